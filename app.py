@@ -2,8 +2,10 @@
 app.py - Main Flask application for AI Fashion E-Commerce Platform
 """
 
+import io
 import os
 import sys
+import time
 from dotenv import load_dotenv
 
 # Auto-load .env file (contains GEMINI_API_KEY)
@@ -18,6 +20,7 @@ if sys.stdout.encoding and sys.stdout.encoding.lower() != 'utf-8':
 
 from flask import (
     Flask,
+    Response,
     render_template,
     request,
     jsonify,
@@ -25,12 +28,52 @@ from flask import (
     redirect,
     url_for,
 )
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from PIL import Image, ImageOps, UnidentifiedImageError
+import orjson
 from database import get_product_by_id, get_featured_products, get_categories
-from search import text_search, image_search, get_outfit_recommendations
+from search import (
+    search_products,
+    stream_fashion_advice,
+    image_search,
+    get_outfit_recommendations,
+)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Serialize API responses with orjson (C, SIMD) instead of the stdlib json."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(
+            obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        # The session serializer passes object_hook, which orjson lacks
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.secret_key = os.environ.get("SECRET_KEY", "fashion-ai-secret-2024")
 
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 300})
+
+
+# Only the Gemini-backed endpoints are limited (per client IP); pages stay unthrottled
+limiter = Limiter(get_remote_address, app=app, storage_uri="memory://")
+GEMINI_RATE_LIMIT = "20/minute;60/hour"
+
+
+@app.errorhandler(429)
+def rate_limited(e):
+    return jsonify({"error": "Too many searches. Please wait a moment and try again."}), 429
+
 # ── Check setup ──────────────────────────────────────────────
 DB_PATH = os.path.join(os.path.dirname(__file__), "fashion.db")
 CHROMA_PATH = os.path.join(os.path.dirname(__file__), "chroma_db")
@@ -40,6 +83,48 @@ def is_setup_complete():
     return os.path.exists(DB_PATH) and os.path.exists(CHROMA_PATH)
 
 
+# ── Cached helpers ───────────────────────────────────────────
+
+FEATURED_REFRESH_SECONDS = 30
+
+
+@cache.memoize(300)
+def _cached_categories():
+    return get_categories()
+
+
+@cache.memoize(FEATURED_REFRESH_SECONDS)
+def _featured_bucket(bucket, n=12):
+    # `bucket` only keys the cache so the random pick rotates periodically
+    return get_featured_products(n)
+
+
+def cached_featured_products(n=12):
+    """Random featured products, shared across requests within a time bucket."""
+    return _featured_bucket(int(time.time() // FEATURED_REFRESH_SECONDS), n)
+
+
+# ── Image upload ─────────────────────────────────────────────
+
+MAX_IMAGE_SIZE = (512, 512)
+
+
+def prepare_image(file) -> bytes:
+    """Decode an upload, upright it, shrink it to MAX_IMAGE_SIZE and re-encode as JPEG."""
+    img = Image.open(file.stream)
+    # Re-encoding drops EXIF, so bake the orientation into the pixels first
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail(MAX_IMAGE_SIZE, Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85, optimize=True)
+    return buf.getvalue()
+
+
+def sse_event(payload: dict) -> str:
+    """Format a payload as one Server-Sent Events message."""
+    return f"data: {app.json.dumps(payload)}\n\n"
+
+
 # ── Routes ───────────────────────────────────────────────────
 
 @app.route("/")
@@ -47,8 +132,8 @@ def index():
     if not is_setup_complete():
         return render_template("setup_required.html")
 
-    featured = get_featured_products(12)
-    categories = get_categories()
+    featured = cached_featured_products(12)
+    categories = _cached_categories()
     return render_template("index.html", featured=featured, categories=categories)
 
 
@@ -58,7 +143,7 @@ def product_detail(product_id):
     if not product:
         return redirect(url_for("index"))
 
-    outfit_data = get_outfit_recommendations(product_id)
+    outfit_data = get_outfit_recommendations(product_id, product=product)
     return render_template(
         "product.html",
         product=product,
@@ -70,6 +155,7 @@ def product_detail(product_id):
 # ── API Endpoints ────────────────────────────────────────────
 
 @app.route("/api/search", methods=["POST"])
+@limiter.limit(GEMINI_RATE_LIMIT)
 def api_search():
     data = request.get_json()
     query = data.get("query", "").strip()
@@ -77,29 +163,37 @@ def api_search():
     if not query:
         return jsonify({"error": "Query is required"}), 400
 
-    # Add to conversation history
+    # Add to conversation history. The advice is streamed after the session
+    # cookie has been sent, so only the user's turn can be recorded here.
     if "conversation" not in session:
         session["conversation"] = []
 
     session["conversation"].append({"role": "user", "text": query})
-
-    result = text_search(query, n_results=12)
-
-    session["conversation"].append({
-        "role": "assistant",
-        "text": result.get("advice", ""),
-    })
     session.modified = True
 
-    return jsonify({
-        "products": result["products"],
-        "advice": result.get("advice", ""),
-        "filters": result.get("filters", {}),
-        "count": len(result["products"]),
-    })
+    result = search_products(query, n_results=12)
+    products = result["products"]
+
+    def generate():
+        # Products first, so results render before Gemini starts writing
+        yield sse_event({
+            "products": products,
+            "filters": result.get("filters", {}),
+            "count": len(products),
+        })
+        for chunk in stream_fashion_advice(query, products[:4]):
+            yield sse_event({"advice_chunk": chunk})
+        yield sse_event({"done": True})
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/api/image-search", methods=["POST"])
+@limiter.limit(GEMINI_RATE_LIMIT)
 def api_image_search():
     if "image" not in request.files:
         return jsonify({"error": "No image provided"}), 400
@@ -108,7 +202,11 @@ def api_image_search():
     if not file.filename:
         return jsonify({"error": "No image selected"}), 400
 
-    image_bytes = file.read()
+    try:
+        image_bytes = prepare_image(file)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return jsonify({"error": "Unsupported or corrupt image"}), 400
+
     result = image_search(image_bytes, n_results=12)
 
     return jsonify({
@@ -130,7 +228,7 @@ def api_recommend(product_id):
 
 @app.route("/api/featured")
 def api_featured():
-    products = get_featured_products(12)
+    products = cached_featured_products(12)
     return jsonify({"products": products})
 
 
@@ -3,43 +3,63 @@ database.py - SQLite helper for fashion products
 """
 
 import sqlite3
+import threading
+from functools import lru_cache
 import pandas as pd
 import os
 import random
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "fashion.db")
 
+# One connection per thread, reused across requests. The thread-local holds
+# the only reference, so a connection is closed when its thread exits.
+# WAL journaling is set once by setup_database.py (it persists in the file).
+_local = threading.local()
+
 
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        _local.conn = conn
     return conn
 
 
 def get_products_by_ids(product_ids):
-    """Return list of product dicts for given product IDs."""
+    """Return list of product dicts for given product IDs, in the order given."""
     if not product_ids:
         return []
     conn = get_connection()
-    placeholders = ",".join("?" for _ in product_ids)
+    ids = [int(pid) for pid in product_ids]
+    placeholders = ",".join("?" for _ in ids)
+    order_case = " ".join(f"WHEN {pid} THEN {i}" for i, pid in enumerate(ids))
     rows = conn.execute(
-        f"SELECT * FROM products WHERE ProductId IN ({placeholders})",
-        [int(pid) for pid in product_ids],
+        f"SELECT * FROM products WHERE ProductId IN ({placeholders}) "
+        f"ORDER BY CASE ProductId {order_case} END",
+        ids,
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 
-def get_product_by_id(product_id):
-    """Return a single product dict."""
+@lru_cache(maxsize=4096)
+def _get_product_row(product_id):
     conn = get_connection()
     row = conn.execute(
-        "SELECT * FROM products WHERE ProductId = ?", (int(product_id),)
+        "SELECT * FROM products WHERE ProductId = ?", (product_id,)
     ).fetchone()
-    conn.close()
     return dict(row) if row else None
 
 
+def get_product_by_id(product_id):
+    """Return a single product dict (cached; the table is read-only at runtime)."""
+    product = _get_product_row(int(product_id))
+    return dict(product) if product else None
+
+
 def get_all_products(limit=None):
     """Return all products as a list of dicts."""
     conn = get_connection()
@@ -47,18 +67,22 @@ def get_all_products(limit=None):
     if limit:
         query += f" LIMIT {limit}"
     rows = conn.execute(query).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 
 def get_featured_products(n=12):
     """Return random featured products for the homepage."""
     conn = get_connection()
+    # Shuffle only the ProductId index, then fetch the n chosen rows
     rows = conn.execute(
-        "SELECT * FROM products ORDER BY RANDOM() LIMIT ?", (n,)
+        "SELECT * FROM products WHERE ProductId IN "
+        "(SELECT ProductId FROM products ORDER BY RANDOM() LIMIT ?)",
+        (n,),
     ).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    # The IN lookup returns rows in index order, so shuffle the sample itself
+    products = [dict(r) for r in rows]
+    random.shuffle(products)
+    return products
 
 
 def get_categories():
@@ -67,5 +91,4 @@ def get_categories():
     rows = conn.execute(
         "SELECT DISTINCT Category, SubCategory FROM products ORDER BY Category"
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
@@ -0,0 +1,114 @@
+"""
+gemini_batcher.py - Micro-batches concurrent Gemini text prompts into one call
+"""
+
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+BATCH_PROMPT_HEADER = """You will receive several independent tasks.
+Answer each task separately, exactly as it asks.
+Return ONLY a valid JSON array of strings (no markdown), where element i is the full answer to task i.
+If a task asks for JSON, put that JSON inside the string for that element.
+
+"""
+
+
+def strip_code_fences(text: str) -> str:
+    """Remove a surrounding ```json ... ``` (or bare ```) markdown fence."""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+class GeminiBatcher:
+    """
+    Collects prompts submitted from request threads and sends them to Gemini
+    together. A background worker waits up to `max_wait` seconds (or until
+    `max_batch` prompts are queued), then hands the batch to a thread pool,
+    which issues one combined prompt and fans the decoded answers back out
+    to each caller's Future. Up to `max_in_flight` Gemini calls overlap.
+
+    Prompts from different callers end up in the same request, so only
+    submit prompts built from trusted data (e.g. catalog fields), never
+    raw user input: one task could otherwise rewrite another's answer.
+    """
+
+    def __init__(self, generate, max_batch: int = 8, max_wait: float = 0.025,
+                 max_in_flight: int = 8):
+        self._generate = generate
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, prompt: str) -> Future:
+        """Queue a prompt; the returned Future resolves to the response text."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((future, prompt))
+        return future
+
+    def generate(self, prompt: str) -> str:
+        """Blocking helper: submit a prompt and wait for its answer."""
+        return self.submit(prompt).result()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Collection continues while the batch is sent
+            self._pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        if len(batch) == 1:
+            self._generate_one(*batch[0])
+            return
+
+        # Fixed instructions first, variable tasks last, so the shared prefix
+        # stays identical across batches.
+        tasks = "\n\n".join(
+            f"### Task {i}\n{prompt}" for i, (_, prompt) in enumerate(batch, 1)
+        )
+        try:
+            text = self._generate(BATCH_PROMPT_HEADER + tasks)
+            answers = json.loads(strip_code_fences(text))
+            if not isinstance(answers, list) or len(answers) != len(batch):
+                raise ValueError(f"expected {len(batch)} answers, got {answers!r:.80}")
+        except Exception as e:
+            print(f"Gemini batch error: {e}, falling back to single calls...")
+            for future, prompt in batch:
+                self._pool.submit(self._generate_one, future, prompt)
+            return
+
+        for (future, _), answer in zip(batch, answers):
+            future.set_result(answer if isinstance(answer, str) else json.dumps(answer))
+
+    def _generate_one(self, future: Future, prompt: str):
+        try:
+            future.set_result(self._generate(prompt))
+        except Exception as e:
+            future.set_exception(e)
@@ -4,21 +4,42 @@ search.py - AI-powered search logic using ChromaDB + Gemini
 
 import os
 import base64
+import hashlib
 import json
-import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import zip_longest
 import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+import numpy as np
+import pandas as pd
+import torch
+from sentence_transformers import SentenceTransformer
 import google.genai as genai
+from cachelib import NullCache, SimpleCache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 from dotenv import load_dotenv
-from database import get_products_by_ids
+from database import get_connection, get_products_by_ids
+from gemini_batcher import GeminiBatcher, strip_code_fences
 
 load_dotenv()
 
 
 CHROMA_PATH = os.path.join(os.path.dirname(__file__), "chroma_db")
+EMBEDDINGS_PATH = os.path.join(os.path.dirname(__file__), "embeddings.npz")
 
 _gemini_client = None
 _chroma_collection = None
+_embedding_model = None
+_embedding_index = None
+_shared_cache = None
+
+# How long Gemini advice stays cached (seconds)
+ADVICE_CACHE_TIMEOUT = 24 * 60 * 60
+_advice_cache = SimpleCache(threshold=4096, default_timeout=ADVICE_CACHE_TIMEOUT)
+
+NO_PRODUCTS_ADVICE = "I couldn't find products matching your query. Try different keywords!"
 
 
 def _get_gemini():
@@ -29,6 +50,41 @@ def _get_gemini():
     return _gemini_client
 
 
+def _get_shared_cache():
+    """
+    Cache shared across worker processes: Redis when REDIS_URL is set,
+    otherwise a no-op (the per-process caches still apply).
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        redis_url = os.environ.get("REDIS_URL")
+        if redis_url:
+            import redis
+            from cachelib.redis import RedisCache
+            _shared_cache = RedisCache(
+                host=redis.Redis.from_url(redis_url), key_prefix="fashion-ai:"
+            )
+        else:
+            _shared_cache = NullCache()
+    return _shared_cache
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429
+
+
+# Back off and retry when Gemini reports quota exhaustion (HTTP 429).
+# Retries sleep on the calling request thread, or on a GeminiBatcher pool
+# thread for batched prompts, never on the batcher's collector thread.
+_retry_on_rate_limit = retry(
+    retry=retry_if_exception(_is_rate_limited),
+    wait=wait_exponential(min=1, max=8),
+    stop=stop_after_attempt(3),
+    reraise=True,
+)
+
+
+@_retry_on_rate_limit
 def _generate(prompt: str) -> str:
     """Generate text with Gemini."""
     client = _get_gemini()
@@ -39,6 +95,51 @@ def _generate(prompt: str) -> str:
     return response.text.strip()
 
 
+# Runs speculative vector searches while the request thread waits on Gemini
+_executor = ThreadPoolExecutor(max_workers=8)
+
+# Concurrent text prompts from different requests share one Gemini call.
+# Only prompts without raw user input may be batched (see GeminiBatcher).
+_batcher = GeminiBatcher(_generate)
+
+
+def _generate_batched(prompt: str) -> str:
+    """
+    Generate text with Gemini, batched with other in-flight prompts.
+    Never pass prompts containing user text; use _generate() for those.
+    """
+    return _batcher.generate(prompt)
+
+
+@_retry_on_rate_limit
+def _start_stream(prompt: str):
+    """Open a Gemini stream and read up to its first text chunk.
+
+    A 429 surfaces while opening or on the first read, so retrying up to
+    this point is safe: nothing has been sent to the client yet.
+    """
+    client = _get_gemini()
+    stream = iter(client.models.generate_content_stream(
+        model="gemini-1.5-flash",
+        contents=prompt,
+    ))
+    for chunk in stream:
+        if chunk.text:
+            return chunk.text, stream
+    return "", stream
+
+
+def _generate_stream(prompt: str):
+    """Yield Gemini's text output chunk by chunk as it is generated."""
+    first, stream = _start_stream(prompt)
+    if first:
+        yield first
+    for chunk in stream:
+        if chunk.text:
+            yield chunk.text
+
+
+@_retry_on_rate_limit
 def _generate_with_image(prompt: str, image_bytes: bytes) -> str:
     """Generate text with Gemini Vision."""
     import base64
@@ -53,22 +154,179 @@ def _generate_with_image(prompt: str, image_bytes: bytes) -> str:
     return response.text.strip()
 
 
+def _get_model():
+    global _embedding_model
+    if _embedding_model is None:
+        model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+        # INT8 dynamic quantization of the Linear layers: queries are encoded
+        # on CPU per request, so this is the latency-critical forward pass.
+        _embedding_model = torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return _embedding_model
+
+
+def _embed(texts: list) -> list:
+    """Encode query texts the same way setup_database.py encodes products."""
+    embeddings = _get_model().encode(
+        texts, convert_to_numpy=True, normalize_embeddings=True
+    )
+    return embeddings.tolist()
+
+
 def _get_collection():
     global _chroma_collection
     if _chroma_collection is None:
-        embedding_fn = SentenceTransformerEmbeddingFunction("all-MiniLM-L6-v2")
+        # Product embeddings are precomputed at setup; queries are embedded
+        # with _embed(), so the collection needs no embedding function.
         client = chromadb.PersistentClient(path=CHROMA_PATH)
         _chroma_collection = client.get_collection(
-            name="fashion_products", embedding_function=embedding_fn
+            name="fashion_products", embedding_function=None
         )
     return _chroma_collection
 
 
-def parse_query_with_gemini(query: str) -> dict:
+# Filter keys → product columns held as categorical arrays for masking
+FILTER_COLUMNS = {
+    "gender": "Gender",
+    "color": "Colour",
+    "usage": "Usage",
+    "product_type": "ProductType",
+    "category": "Category",
+}
+
+
+def _get_index():
     """
-    Use Gemini to extract structured fashion filters from natural language.
-    Returns a dict with keys: search_text, max_price, gender, color, usage, product_type
+    Load the product embedding matrix written by setup_database.py, plus
+    per-column metadata arrays aligned with its rows (structure of arrays).
+    Returns ((codes, row_scale), product_ids, metadata), or None if the file
+    doesn't exist.
+    """
+    global _embedding_index
+    if _embedding_index is None and os.path.exists(EMBEDDINGS_PATH):
+        data = np.load(EMBEDDINGS_PATH)
+        if "Eq" in data:
+            # int8 codes stay int8 in memory; see _score()
+            codes, scale = data["Eq"], data["scale"]
+        else:
+            codes = data["E"]
+            scale = np.ones(len(codes), dtype=np.float32)
+        # q · (scale·c) / |scale·c|: apply each vector's scale and the
+        # dequantized norm as one factor, so code dot products are cosines
+        dequantized_norms = scale * _row_norms(codes)
+        row_scale = (scale / dequantized_norms).astype(np.float32)
+
+        columns = ", ".join(FILTER_COLUMNS.values())
+        meta = pd.read_sql(
+            f"SELECT ProductId, {columns}, Price FROM products",
+            get_connection(),
+            index_col="ProductId",
+        ).reindex(data["ids"])
+        metadata = {col: pd.Categorical(meta[col]) for col in FILTER_COLUMNS.values()}
+        metadata["Price"] = meta["Price"].to_numpy(np.int32)
+
+        _embedding_index = ((codes, row_scale), data["ids"].astype(str), metadata)
+    return _embedding_index
+
+
+# Rows widened to float32 at a time when scoring. 256 x 384 float32 is
+# ~384 KB, so each widened block stays L2-resident for its GEMM while the
+# resident matrix stays int8
+SCORE_BLOCK_ROWS = 256
+
+
+def _row_norms(codes):
+    norms = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+        block = codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+        norms[start:start + SCORE_BLOCK_ROWS] = np.linalg.norm(block, axis=1)
+    return norms
+
+
+def _score(query_embeddings, codes, row_scale):
+    """
+    Cosine similarity of each query against every product, computed from
+    the int8 codes in L2-sized blocks (each block is one BLAS float32 GEMM;
+    NumPy has no int8 GEMM) and rescaled with the per-vector factors.
+    """
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+        block = codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+        scores[:, start:start + SCORE_BLOCK_ROWS] = queries @ block.T
+    scores *= row_scale
+    return scores
+
+
+def build_mask(filters: dict, metadata: dict):
+    """Boolean mask over the in-memory index rows matching the filters."""
+    mask = np.ones(len(metadata["Price"]), dtype=bool)
+
+    for key, column in FILTER_COLUMNS.items():
+        if filters.get(key):
+            values = metadata[column]
+            if filters[key] in values.categories:
+                mask &= values.codes == values.categories.get_loc(filters[key])
+            else:
+                mask[:] = False
+    if filters.get("max_price"):
+        mask &= metadata["Price"] <= int(filters["max_price"])
+    if filters.get("min_price"):
+        mask &= metadata["Price"] >= int(filters["min_price"])
+
+    return mask
+
+
+def _top_k(scores, n_results: int):
+    """Indices of the n_results highest scores, best first."""
+    n_results = min(n_results, len(scores))
+    if n_results < len(scores):
+        top = np.argpartition(-scores, n_results - 1)[:n_results]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top])]
+
+
+def _vector_query(query_embeddings, n_results: int, filters: dict = None) -> dict:
+    """
+    Nearest products for each query embedding, in Chroma's result shape.
+    Runs as one matrix product against the in-memory index, with filters
+    applied as a row mask; falls back to Chroma if the index is missing.
     """
+    index = _get_index()
+    if index is None:
+        where = build_chroma_where(filters or {})
+        kwargs = {"where": where} if where else {}
+        return _get_collection().query(
+            query_embeddings=query_embeddings, n_results=n_results, **kwargs
+        )
+
+    (codes, row_scale), product_ids, metadata = index
+    scores = _score(query_embeddings, codes, row_scale)
+    if filters:
+        scores[:, ~build_mask(filters, metadata)] = -np.inf
+
+    id_lists = []
+    for row in scores:
+        top = _top_k(row, n_results)
+        top = top[np.isfinite(row[top])]
+        id_lists.append(product_ids[top].tolist())
+    return {"ids": id_lists}
+
+
+def _normalize_query(query: str) -> str:
+    """Lower-case and collapse whitespace so equivalent queries share a cache entry."""
+    return " ".join(query.lower().split())
+
+
+# Parsed filters keyed by normalized query. SimpleCache hands back a fresh
+# copy on every get, so callers can't mutate the cached entry.
+_parse_cache = SimpleCache(threshold=2048, default_timeout=0)
+
+
+def _parse_query(query: str) -> dict:
+    """Ask Gemini for filters. Errors propagate, so failures are never cached."""
     prompt = f"""You are a fashion search assistant. Extract search parameters from this query.
 Return ONLY valid JSON (no markdown, no explanation).
 
@@ -91,11 +349,25 @@ Examples:
 - "suggest party wear, no baggy clothes" → search_text:"party wear fitted clothes"
 - "casual sneakers for women" → search_text:"casual sneakers women", gender:"Women", usage:"Casual"
 """
+    # The prompt embeds the user's query, so it's sent on its own
+    text = _generate(prompt)
+    # Remove markdown code blocks if present
+    return json.loads(strip_code_fences(text))
+
+
+def parse_query_with_gemini(query: str) -> dict:
+    """
+    Use Gemini to extract structured fashion filters from natural language.
+    Returns a dict with keys: search_text, max_price, gender, color, usage, product_type
+    """
+    key = _normalize_query(query)
+    parsed = _parse_cache.get(key)
+    if parsed is not None:
+        return parsed
     try:
-        text = _generate(prompt)
-        # Remove markdown code blocks if present
-        text = re.sub(r"```json\s*|\s*```", "", text).strip()
-        return json.loads(text)
+        parsed = _parse_query(key)
+        _parse_cache.set(key, parsed)
+        return parsed
     except Exception as e:
         print(f"Gemini parse error: {e}")
         return {"search_text": query, "max_price": None, "min_price": None,
@@ -103,6 +375,48 @@ Examples:
                 "product_type": None, "category": None}
 
 
+@lru_cache(maxsize=1)
+def _valid_filter_values() -> dict:
+    """Lower-cased value → canonical value, per filterable column."""
+    conn = get_connection()
+    valid = {}
+    for column in FILTER_COLUMNS.values():
+        rows = conn.execute(f"SELECT DISTINCT {column} FROM products").fetchall()
+        valid[column] = {row[0].lower(): row[0] for row in rows if row[0]}
+    return valid
+
+
+def sanitize_filters(filters: dict) -> dict:
+    """
+    Normalize filters to values that exist in the catalog, case-insensitively.
+    Conditions that could never match (or prices that aren't numbers) are
+    dropped, so searches never carry an impossible filter.
+    """
+    filters = dict(filters)
+    valid = _valid_filter_values()
+
+    for key, column in FILTER_COLUMNS.items():
+        value = filters.get(key)
+        if not value:
+            continue
+        canonical = valid[column].get(str(value).strip().lower())
+        if canonical is None:
+            print(f"Ignoring {key} filter {value!r}: not in catalog")
+        filters[key] = canonical
+
+    for key in ("max_price", "min_price"):
+        value = filters.get(key)
+        if not value:
+            continue
+        try:
+            filters[key] = int(value)
+        except (TypeError, ValueError):
+            print(f"Ignoring {key} filter {value!r}: not a number")
+            filters[key] = None
+
+    return filters
+
+
 def build_chroma_where(filters: dict) -> dict:
     """Build ChromaDB where clause from filters."""
     conditions = []
@@ -130,69 +444,86 @@ def build_chroma_where(filters: dict) -> dict:
         return {"$and": conditions}
 
 
-def text_search(query: str, n_results: int = 12) -> dict:
+def batched_query(texts: list, n_results: int, filters: list = None) -> list:
+    """
+    Run several semantic queries with as few vector-store calls as possible.
+    All texts are embedded in one forward pass; texts sharing the same
+    filters are searched together in a single multi-query call.
+    Returns one list of product ids per input text, in input order.
     """
-    Full AI text search pipeline:
+    filters = filters or [None] * len(texts)
+    embeddings = _embed(texts)
+
+    groups = {}
+    for i, text_filters in enumerate(filters):
+        key = json.dumps(text_filters, sort_keys=True)
+        groups.setdefault(key, (text_filters, []))[1].append(i)
+
+    id_lists = [[] for _ in texts]
+    for text_filters, indices in groups.values():
+        results = _vector_query(
+            query_embeddings=[embeddings[i] for i in indices],
+            n_results=n_results,
+            filters=text_filters,
+        )
+        for i, ids in zip(indices, results["ids"] or []):
+            id_lists[i] = ids
+    return id_lists
+
+
+def _query_unfiltered(text: str, n_results: int) -> dict:
+    """Plain semantic search for `text` with no metadata filter."""
+    return _vector_query(
+        query_embeddings=_embed([text]), n_results=n_results
+    )
+
+
+def search_products(query: str, n_results: int = 12) -> dict:
+    """
+    Retrieval half of the text search pipeline:
     1. Parse query with Gemini → extract filters
-    2. Run ChromaDB semantic similarity search
+    2. Run semantic similarity search
     3. Fetch product details from SQLite
-    4. Generate fashion advice with Gemini
     """
-    # Step 1: Parse query
-    filters = parse_query_with_gemini(query)
+    # Step 1: Parse query on this thread. If the parse isn't cached, Gemini
+    # is about to be called, so speculatively search the raw query meanwhile
+    # (used as-is when parsing adds no filters and keeps the text, i.e.
+    # mostly when Gemini fails).
+    n = min(n_results, 50)
+    raw_future = None
+    if not _parse_cache.has(_normalize_query(query)):
+        raw_future = _executor.submit(_query_unfiltered, query, n)
+    parsed = parse_query_with_gemini(query)
+
+    filters = sanitize_filters(parsed)
     search_text = filters.get("search_text") or query
 
-    # Step 2: ChromaDB search
-    collection = _get_collection()
+    # Step 2: Semantic search
     where_clause = build_chroma_where(filters)
 
-    try:
-        if where_clause:
-            results = collection.query(
-                query_texts=[search_text],
-                n_results=min(n_results, 50),
-                where=where_clause,
-            )
-        else:
-            results = collection.query(
-                query_texts=[search_text],
-                n_results=min(n_results, 50),
-            )
-    except Exception as e:
-        # If where clause causes issues (no results), fall back to no filter
-        print(f"ChromaDB query error: {e}, retrying without filters...")
-        results = collection.query(
-            query_texts=[search_text],
-            n_results=min(n_results, 50),
+    if not where_clause and search_text == query:
+        results = raw_future.result() if raw_future else _query_unfiltered(query, n)
+    else:
+        if raw_future:
+            raw_future.cancel()
+        results = _vector_query(
+            query_embeddings=_embed([search_text]),
+            n_results=n,
+            filters=filters,
         )
 
     # Step 3: Fetch product details
-    if not results["ids"] or not results["ids"][0]:
-        return {"products": [], "advice": "No products found matching your query.", "filters": filters}
-
-    product_ids = results["ids"][0]
+    product_ids = results["ids"][0] if results["ids"] else []
     products = get_products_by_ids(product_ids)
 
-    # Step 4: Generate fashion advice
-    advice = generate_fashion_advice(query, products[:4])
-
     return {
         "products": products,
-        "advice": advice,
         "filters": filters,
         "search_text": search_text,
     }
 
 
-def image_search(image_bytes: bytes, n_results: int = 12) -> dict:
-    """
-    Image-based search:
-    1. Send image to Gemini Vision → extract fashion attributes
-    2. Run ChromaDB semantic search
-    3. Fetch product details
-    """
-    # Step 1: Analyze image with Gemini Vision
-    analysis_prompt = """Analyze this clothing/fashion image and extract:
+IMAGE_ANALYSIS_PROMPT = """Analyze this clothing/fashion image and extract:
 Return ONLY valid JSON (no markdown).
 {
   "description": "detailed description of the clothing item",
@@ -203,10 +534,40 @@ Return ONLY valid JSON (no markdown).
   "search_query": "best search query to find similar items"
 }"""
 
+# Gemini Vision analyses keyed by image digest, so re-uploads skip the call
+_IMAGE_CACHE_SIZE = 256
+_image_analysis_cache = OrderedDict()
+_image_cache_lock = threading.Lock()
+
+
+def _analyze_image(image_bytes: bytes) -> dict:
+    """Extract fashion attributes from an image with Gemini Vision (cached)."""
+    key = hashlib.blake2b(image_bytes, digest_size=16).digest()
+    with _image_cache_lock:
+        if key in _image_analysis_cache:
+            _image_analysis_cache.move_to_end(key)
+            return dict(_image_analysis_cache[key])
+
+    text = _generate_with_image(IMAGE_ANALYSIS_PROMPT, image_bytes)
+    analysis = json.loads(strip_code_fences(text))
+
+    with _image_cache_lock:
+        _image_analysis_cache[key] = analysis
+        if len(_image_analysis_cache) > _IMAGE_CACHE_SIZE:
+            _image_analysis_cache.popitem(last=False)
+    return dict(analysis)
+
+
+def image_search(image_bytes: bytes, n_results: int = 12) -> dict:
+    """
+    Image-based search:
+    1. Send image to Gemini Vision → extract fashion attributes
+    2. Run ChromaDB semantic search
+    3. Fetch product details
+    """
+    # Step 1: Analyze image with Gemini Vision
     try:
-        text = _generate_with_image(analysis_prompt, image_bytes)
-        text = re.sub(r"```json\s*|\s*```", "", text).strip()
-        analysis = json.loads(text)
+        analysis = _analyze_image(image_bytes)
     except Exception as e:
         print(f"Gemini Vision error: {e}")
         analysis = {
@@ -218,9 +579,8 @@ Return ONLY valid JSON (no markdown).
 
     # Step 2: ChromaDB search
     search_text = analysis.get("search_query", analysis.get("description", "fashion"))
-    collection = _get_collection()
 
-    filters = {
+    filters = sanitize_filters({
         "gender": analysis.get("gender") if analysis.get("gender") not in ["Unisex", None] else None,
         "color": analysis.get("color"),
         "max_price": None,
@@ -228,16 +588,8 @@ Return ONLY valid JSON (no markdown).
         "usage": None,
         "product_type": None,
         "category": None,
-    }
-    where_clause = build_chroma_where(filters)
-
-    try:
-        if where_clause:
-            results = collection.query(query_texts=[search_text], n_results=n_results, where=where_clause)
-        else:
-            results = collection.query(query_texts=[search_text], n_results=n_results)
-    except Exception as e:
-        results = collection.query(query_texts=[search_text], n_results=n_results)
+    })
+    results = _vector_query(query_embeddings=_embed([search_text]), n_results=n_results, filters=filters)
 
     product_ids = results["ids"][0] if results["ids"] else []
     products = get_products_by_ids(product_ids)
@@ -253,11 +605,15 @@ Return ONLY valid JSON (no markdown).
     }
 
 
-def get_outfit_recommendations(product_id: int) -> dict:
-    """Get complementary outfit items for a given product."""
+def get_outfit_recommendations(product_id: int, product: dict = None) -> dict:
+    """
+    Get complementary outfit items for a given product.
+    Pass `product` when the caller already fetched it to skip the lookup.
+    """
     from database import get_product_by_id
-    
-    product = get_product_by_id(product_id)
+
+    if product is None:
+        product = get_product_by_id(product_id)
     if not product:
         return {"products": [], "advice": "Product not found."}
 
@@ -271,30 +627,50 @@ def get_outfit_recommendations(product_id: int) -> dict:
     else:
         complement = f"{product['Usage']} fashion for {product['Gender']}"
 
-    collection = _get_collection()
-    # Exclude current product
-    results = collection.query(
-        query_texts=[complement],
+    # Complementary items and items similar to this one, in one Chroma call
+    gender_filter = {"gender": product["Gender"]}
+    complement_ids, similar_ids = batched_query(
+        [complement, product["ProductTitle"]],
         n_results=6,
-        where={"Gender": {"$eq": product["Gender"]}},
+        filters=[gender_filter, gender_filter],
     )
-    
-    # Filter out the current product itself
-    product_ids = [pid for pid in (results["ids"][0] if results["ids"] else []) if pid != str(product_id)]
+
+    # Interleave both lists, dropping duplicates and the current product itself
+    product_ids = []
+    seen = {str(product_id)}
+    for pair in zip_longest(complement_ids, similar_ids):
+        for pid in pair:
+            if pid is not None and pid not in seen:
+                seen.add(pid)
+                product_ids.append(pid)
     products = get_products_by_ids(product_ids[:6])
 
-    advice = generate_outfit_advice(product, products)
+    # Style advice is about pairing, so only the complementary hits count;
+    # the look-alikes are shown but not pitched as items to wear it "with"
+    complement_set = set(complement_ids)
+    complements = [p for p in products if str(p["ProductId"]) in complement_set]
+    advice = generate_outfit_advice(product, complements)
 
     return {"products": products, "advice": advice, "base_product": product}
 
 
-def generate_fashion_advice(query: str, products: list) -> str:
-    """Generate fashion advice using Gemini based on query and products."""
-    if not products:
-        return "I couldn't find products matching your query. Try different keywords!"
+def _advice_request(query: str, products: list) -> tuple:
+    """
+    Cache key and Gemini prompt for advice on a query's top four products.
+    The key covers the normalized query and the products' (id, title,
+    colour, price), so identical searches share advice across sessions.
+    """
+    query = _normalize_query(query)
+    top_products = [
+        (p["ProductId"], p["ProductTitle"], p["Colour"], p["Price"])
+        for p in products[:4]
+    ]
+    cache_key = "advice:" + hashlib.blake2b(
+        json.dumps([query, top_products]).encode(), digest_size=16
+    ).hexdigest()
 
     product_list = "\n".join(
-        [f"- {p['ProductTitle']} ({p['Colour']}, ₹{p['Price']})" for p in products[:4]]
+        [f"- {title} ({colour}, ₹{price})" for _, title, colour, price in top_products]
     )
 
     prompt = f"""You are a friendly AI fashion stylist. A customer asked: "{query}"
@@ -304,10 +680,62 @@ Top matching products found:
 
 Give a SHORT, enthusiastic fashion advice response (2-3 sentences max) explaining why these products match and any styling tips. Be conversational and helpful. Do NOT list the products again."""
 
+    return cache_key, prompt
+
+
+def _get_cached_advice(cache_key: str):
+    advice = _advice_cache.get(cache_key)
+    if advice is None:
+        try:
+            advice = _get_shared_cache().get(cache_key)
+        except Exception as e:
+            # A shared-cache outage just means asking Gemini
+            print(f"Shared cache error: {e}")
+            return None
+        if advice:
+            _advice_cache.set(cache_key, advice)
+    return advice
+
+
+def _cache_advice(cache_key: str, advice: str):
+    _advice_cache.set(cache_key, advice)
+    try:
+        _get_shared_cache().set(cache_key, advice, timeout=ADVICE_CACHE_TIMEOUT)
+    except Exception as e:
+        print(f"Shared cache error: {e}")
+
+
+def _fallback_advice(query: str, products: list) -> str:
+    return f"Great picks! Here are {len(products)} items that match '{query}'. These selections are curated based on your preferences."
+
+
+def stream_fashion_advice(query: str, products: list):
+    """
+    Generate fashion advice using Gemini based on query and products,
+    yielding the text in chunks as Gemini produces them.
+    Cached advice is yielded as a single chunk.
+    """
+    if not products:
+        yield NO_PRODUCTS_ADVICE
+        return
+
+    cache_key, prompt = _advice_request(query, products)
+    advice = _get_cached_advice(cache_key)
+    if advice:
+        yield advice
+        return
+
+    chunks = []
     try:
-        return _generate(prompt)
+        for chunk in _generate_stream(prompt):
+            chunks.append(chunk)
+            yield chunk
     except Exception as e:
-        return f"Great picks! Here are {len(products)} items that match '{query}'. These selections are curated based on your preferences."
+        print(f"Gemini stream error: {e}")
+        if not chunks:
+            yield _fallback_advice(query, products)
+        return
+    _cache_advice(cache_key, "".join(chunks).strip())
 
 
 def generate_outfit_advice(base_product: dict, complement_products: list) -> str:
@@ -322,6 +750,6 @@ Suggest how to style it with these complementary items (1-2 sentences, be specif
 {', '.join([p['ProductTitle'] for p in complement_products[:3]])}"""
 
     try:
-        return _generate(prompt)
+        return _generate_batched(prompt)
     except Exception as e:
         return "Complete your look with these perfectly matched items! Mix and match for a stylish outfit."
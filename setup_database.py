@@ -5,6 +5,7 @@ Run this ONE TIME to:
   1. Read fashion.csv
   2. Create SQLite database (fashion.db) with products table
   3. Generate sentence embeddings and store in ChromaDB
+  4. Save the int8 embedding matrix (embeddings.npz) for in-memory search
 
 Usage:
     python setup_database.py
@@ -23,15 +24,16 @@ if sys.stdout.encoding != 'utf-8':
     except AttributeError:
         pass
 import sqlite3
+import numpy as np
 import pandas as pd
-import random
 import chromadb
+import torch
 from sentence_transformers import SentenceTransformer
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 
 CSV_PATH = os.path.join(os.path.dirname(__file__), "fashion.csv")
 DB_PATH = os.path.join(os.path.dirname(__file__), "fashion.db")
 CHROMA_PATH = os.path.join(os.path.dirname(__file__), "chroma_db")
+EMBEDDINGS_PATH = os.path.join(os.path.dirname(__file__), "embeddings.npz")
 
 # Price ranges for each product type (simulated since dataset has no prices)
 PRICE_MAP = {
@@ -61,26 +63,70 @@ PRICE_MAP = {
 DEFAULT_PRICE_RANGE = (499, 2999)
 
 
-def generate_price(product_type):
-    low, high = PRICE_MAP.get(product_type, DEFAULT_PRICE_RANGE)
-    return random.randint(low // 100, high // 100) * 100
+def generate_prices(product_types, rng):
+    """Draw a price (a multiple of 100) per product from its type's range."""
+    low, high = DEFAULT_PRICE_RANGE
+    lows = product_types.map({k: v[0] for k, v in PRICE_MAP.items()}).fillna(low)
+    highs = product_types.map({k: v[1] for k, v in PRICE_MAP.items()}).fillna(high)
+    lows = lows.to_numpy(dtype=np.int64) // 100
+    highs = highs.to_numpy(dtype=np.int64) // 100
+    return rng.integers(lows, highs + 1) * 100
 
 
-def create_text_description(row):
-    """Create a rich text description for embedding."""
-    parts = [
-        row["ProductTitle"],
-        f"Color: {row['Colour']}",
-        f"Gender: {row['Gender']}",
-        f"Category: {row['Category']}",
-        f"Type: {row['ProductType']}",
-        f"Sub-category: {row['SubCategory']}",
-        f"Usage: {row['Usage']}",
+def create_text_descriptions(df):
+    """Create a rich text description for embedding, for every row at once."""
+    return (
+        df["ProductTitle"]
+        + " | Color: " + df["Colour"]
+        + " | Gender: " + df["Gender"]
+        + " | Category: " + df["Category"]
+        + " | Type: " + df["ProductType"]
+        + " | Sub-category: " + df["SubCategory"]
+        + " | Usage: " + df["Usage"]
         # Add synonyms for better search
-        f"This is a {row['Colour'].lower()} {row['ProductType'].lower()} for {row['Gender'].lower()}.",
-        f"Suitable for {row['Usage'].lower()} occasions.",
-    ]
-    return " | ".join(parts)
+        + " | This is a " + df["Colour"].str.lower()
+        + " " + df["ProductType"].str.lower()
+        + " for " + df["Gender"].str.lower() + "."
+        + " | Suitable for " + df["Usage"].str.lower() + " occasions."
+    )
+
+
+METADATA_COLUMNS = [
+    "ProductId", "ProductTitle", "Gender", "Category", "SubCategory",
+    "ProductType", "Colour", "Usage", "Price", "ImageURL",
+]
+
+
+def quantize_embeddings(embeddings):
+    """Symmetric per-vector int8 quantization: returns (codes, scale)."""
+    scale = np.abs(embeddings).max(axis=1) / 127
+    scale[scale == 0] = 1.0
+    codes = np.round(embeddings / scale[:, None]).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+def quantized_recall(embeddings, codes, scale, k=12, n_queries=200):
+    """
+    Share of FP32 top-k neighbours the int8 matrix still returns.
+    Sampled products serve as queries but are held out of both rankings,
+    so a query can't trivially match itself.
+    """
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)
+    queries = embeddings[sample]
+    dequantized = codes.astype(np.float32) * scale[:, None]
+    dequantized /= np.linalg.norm(dequantized, axis=1, keepdims=True)
+
+    exact_scores = queries @ embeddings.T
+    approx_scores = queries @ dequantized.T
+    rows = np.arange(len(sample))
+    exact_scores[rows, sample] = -np.inf
+    approx_scores[rows, sample] = -np.inf
+
+    exact = np.argsort(-exact_scores, axis=1)[:, :k]
+    approx = np.argsort(-approx_scores, axis=1)[:, :k]
+    hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact, approx))
+    return hits / exact.size
 
 
 def setup():
@@ -95,10 +141,10 @@ def setup():
     print(f"    Loaded {len(df)} products.")
 
     # ── 2. Add simulated prices ──────────────────────────────
-    random.seed(42)
-    df["Price"] = df["ProductType"].apply(generate_price)
-    df["Rating"] = [round(random.uniform(3.5, 5.0), 1) for _ in range(len(df))]
-    df["Reviews"] = [random.randint(10, 500) for _ in range(len(df))]
+    rng = np.random.default_rng(42)
+    df["Price"] = generate_prices(df["ProductType"], rng)
+    df["Rating"] = np.round(rng.uniform(3.5, 5.0, len(df)), 1)
+    df["Reviews"] = rng.integers(10, 501, len(df))
 
     # ── 3. Create SQLite DB ──────────────────────────────────
     print("[*] Creating SQLite database (fashion.db)...")
@@ -106,14 +152,30 @@ def setup():
         os.remove(DB_PATH)
 
     conn = sqlite3.connect(DB_PATH)
-    df.to_sql("products", conn, if_exists="replace", index=False)
+    # The file is rebuilt from scratch, so skip journaling and fsyncs during
+    # the bulk load; pandas already inserts everything in one transaction.
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+    df.to_sql("products", conn, if_exists="replace", index=False, chunksize=5000)
+    conn.execute("CREATE UNIQUE INDEX idx_products_pid ON products(ProductId)")
+    conn.execute("CREATE INDEX idx_products_gender_sub ON products(Gender, SubCategory)")
+    conn.commit()
+    # Back to durable settings for runtime reads/writes (see database.py)
+    conn.execute("PRAGMA locking_mode=NORMAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     conn.close()
     print(f"    Saved {len(df)} products to fashion.db.")
 
     # ── 4. Build ChromaDB vector store ───────────────────────
     print("[*] Loading Sentence Transformer model (all-MiniLM-L6-v2)...")
-    model_name = "all-MiniLM-L6-v2"
-    embedding_fn = SentenceTransformerEmbeddingFunction(model_name=model_name)
+    # Embed outside of Chroma so the whole batch goes through one batched
+    # forward pass (on the GPU when available).
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = SentenceTransformer("all-MiniLM-L6-v2", device=device)
+    print(f"    Using device: {device}")
 
     print("[*] Initializing ChromaDB...")
     if os.path.exists(CHROMA_PATH):
@@ -123,42 +185,71 @@ def setup():
     client = chromadb.PersistentClient(path=CHROMA_PATH)
     collection = client.get_or_create_collection(
         name="fashion_products",
-        embedding_function=embedding_fn,
+        embedding_function=None,
         metadata={"hnsw:space": "cosine"},
     )
 
+    # WAL journaling persists in the database file, so Chroma's own
+    # connections pick it up for the bulk load below.
+    chroma_conn = sqlite3.connect(os.path.join(CHROMA_PATH, "chroma.sqlite3"))
+    chroma_conn.execute("PRAGMA journal_mode=WAL")
+    chroma_conn.close()
+
     print("[*] Generating text embeddings for all products...")
-    batch_size = 100
+    # Fewer, larger batches amortize Chroma's per-add transaction overhead
+    max_batch_size = getattr(client, "get_max_batch_size", lambda: 5461)()
+    batch_size = min(max_batch_size, 5000)
     total = len(df)
 
+    # Build every document, id and metadata dict up front; batches just slice
+    all_documents = create_text_descriptions(df).tolist()
+    all_ids = df["ProductId"].astype(str).tolist()
+    all_metadatas = (
+        df[METADATA_COLUMNS]
+        .assign(ProductId=all_ids, Price=df["Price"].astype(int))
+        .to_dict(orient="records")
+    )
+
+    all_embeddings = []
     for start in range(0, total, batch_size):
         end = min(start + batch_size, total)
-        batch = df.iloc[start:end]
-
-        documents = [create_text_description(row) for _, row in batch.iterrows()]
-        ids = [str(row["ProductId"]) for _, row in batch.iterrows()]
-        metadatas = [
-            {
-                "ProductId": str(row["ProductId"]),
-                "ProductTitle": row["ProductTitle"],
-                "Gender": row["Gender"],
-                "Category": row["Category"],
-                "SubCategory": row["SubCategory"],
-                "ProductType": row["ProductType"],
-                "Colour": row["Colour"],
-                "Usage": row["Usage"],
-                "Price": int(row["Price"]),
-                "ImageURL": row["ImageURL"],
-            }
-            for _, row in batch.iterrows()
-        ]
-
-        collection.add(documents=documents, ids=ids, metadatas=metadatas)
+        documents = all_documents[start:end]
+        ids = all_ids[start:end]
+        metadatas = all_metadatas[start:end]
+
+        embeddings = model.encode(
+            documents,
+            batch_size=512,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        all_embeddings.append(embeddings)
+        collection.add(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=embeddings.tolist(),
+        )
         print(f"    Progress: {end}/{total} products embedded...")
 
+    # ── 5. Save the embedding matrix for in-memory search ────
+    print("[*] Saving int8 embedding matrix (embeddings.npz)...")
+    embeddings = np.concatenate(all_embeddings)
+    codes, scale = quantize_embeddings(embeddings)
+    np.savez(
+        EMBEDDINGS_PATH,
+        Eq=codes,
+        scale=scale,
+        ids=df["ProductId"].to_numpy(dtype=np.int64),
+    )
+    recall = quantized_recall(embeddings, codes, scale)
+    print(f"    int8 vs FP32 recall@12: {recall:.3f}")
+
     print(f"\n[OK] Setup complete!")
     print(f"    - SQLite DB:  {DB_PATH}")
     print(f"    - ChromaDB:   {CHROMA_PATH}")
+    print(f"    - Embeddings: {EMBEDDINGS_PATH}")
     print(f"    - Products:   {total}")
     print(f"\n>>> Now run:  python app.py")
 
@@ -34,8 +34,12 @@ async function doTextSearch() {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ query }),
         });
-        const data = await res.json();
-        renderResults(data);
+        const contentType = res.headers.get('Content-Type') || '';
+        if (!contentType.startsWith('text/event-stream')) {
+            renderResponse(await res.json());
+            return;
+        }
+        await readSearchStream(res);
     } catch (err) {
         showError('Search failed. Please try again.');
     } finally {
@@ -43,6 +47,37 @@ async function doTextSearch() {
     }
 }
 
+// ── Streamed search response (Server-Sent Events over fetch) ──
+async function readSearchStream(res) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let advice = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            if (!message.startsWith('data: ')) continue;
+
+            const event = JSON.parse(message.slice(6));
+            if (event.products) {
+                // Products arrive first; advice streams in afterwards
+                renderResults({ products: event.products });
+                showLoading(false);
+            } else if (event.advice_chunk) {
+                advice += event.advice_chunk;
+                renderAdvice(advice);
+            }
+        }
+    }
+}
+
 // ── Image drop / select ─────────────────────────────
 function handleDrop(event) {
     event.preventDefault();
@@ -84,8 +119,7 @@ async function doImageSearch() {
 
     try {
         const res = await fetch('/api/image-search', { method: 'POST', body: formData });
-        const data = await res.json();
-        renderResults(data);
+        renderResponse(await res.json());
     } catch (err) {
         showError('Image search failed. Please try again.');
     } finally {
@@ -93,16 +127,19 @@ async function doImageSearch() {
     }
 }
 
+// ── Render a JSON API response (results or an error) ──
+function renderResponse(data) {
+    if (data.error) {
+        showError(data.error);
+    } else {
+        renderResults(data);
+    }
+}
+
 // ── Render results ──────────────────────────────────
 function renderResults(data) {
     // AI advice
-    const adviceEl = document.getElementById('ai-advice-text');
-    if (data.advice) {
-        adviceEl.innerHTML = formatAdvice(data.advice);
-        document.getElementById('ai-advice').style.display = 'flex';
-    } else {
-        document.getElementById('ai-advice').style.display = 'none';
-    }
+    renderAdvice(data.advice);
 
     // Count
     const count = data.products ? data.products.length : 0;
@@ -128,6 +165,16 @@ function renderResults(data) {
     });
 }
 
+function renderAdvice(advice) {
+    const adviceEl = document.getElementById('ai-advice-text');
+    if (advice) {
+        adviceEl.innerHTML = formatAdvice(advice);
+        document.getElementById('ai-advice').style.display = 'flex';
+    } else {
+        document.getElementById('ai-advice').style.display = 'none';
+    }
+}
+
 // ── Product card DOM ────────────────────────────────
 function createProductCard(p, delay = 0) {
     const card = document.createElement('div');